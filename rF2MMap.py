@@ -6,14 +6,20 @@ with player-synchronized accessing (by S.Victor)
 and cross-platform Linux support (by Bernat)
 """
 
-import copy
 import ctypes
+import gc
 import logging
 import mmap
+import os
 import platform
 import time
 import threading
 
+try:
+    import numpy as np
+except ImportError:  # numpy not installed, use python loop for index lookup
+    np = None
+
 try:
     from . import rF2data
 except ImportError:  # standalone, not package
@@ -21,11 +27,101 @@ except ImportError:  # standalone, not package
 
 PLATFORM = platform.system()
 MAX_VEHICLES = rF2data.rFactor2Constants.MAX_MAPPED_VEHICLES
+VEHICLE_RANGE = range(MAX_VEHICLES)
+SCOR_VEH_OFFSET = rF2data.rF2Scoring.mVehicles.offset
+SCOR_VEH_SIZE = ctypes.sizeof(rF2data.rF2VehicleScoring)
+TELE_VEH_OFFSET = rF2data.rF2Telemetry.mVehicles.offset
+TELE_VEH_SIZE = ctypes.sizeof(rF2data.rF2VehicleTelemetry)
 INVALID_INDEX = -1
+THREAD_PRIORITY_ABOVE_NORMAL = 1  # Windows thread priority
 
 logger = logging.getLogger(__name__)
 
 
+def np_dtype(rf2_struct):
+    """Numpy structured dtype mirroring rf2 data class fields & layout"""
+    fields = rf2_struct._fields_
+    return np.dtype({
+        "names": [name for name, _ in fields],
+        "formats": [np_format(field_type) for _, field_type in fields],
+        "offsets": [getattr(rf2_struct, name).offset for name, _ in fields],
+        "itemsize": ctypes.sizeof(rf2_struct),
+    })
+
+
+def np_format(field_type):
+    """Numpy format of ctypes field type, char array as byte string"""
+    if issubclass(field_type, ctypes.Array):
+        if field_type._type_ is ctypes.c_char:
+            return f"S{field_type._length_}"
+        return (np_format(field_type._type_), field_type._length_)
+    if issubclass(field_type, ctypes.Structure):
+        return np_dtype(field_type)
+    return np.dtype(field_type)
+
+
+if np is not None:
+    SCOR_VEH_DTYPE = np_dtype(rF2data.rF2VehicleScoring)
+    TELE_VEH_DTYPE = np_dtype(rF2data.rF2VehicleTelemetry)
+
+
+def np_first_index(mask) -> int:
+    """First index of True in numpy bool array, INVALID_INDEX if none
+
+    argmax stops at first True for bool arrays, no index array is created.
+    """
+    index = int(mask.argmax())
+    if mask[index]:
+        return index
+    return INVALID_INDEX
+
+
+def version_synced_copy(
+        dest_addr: int, data, src_addr: int, size: int, retry: int = 3) -> bool:
+    """Copy part of mmap data to dest, retry if data updated during copy
+
+    Seqlock style check: read update end version before copy,
+    compare with update begin version after copy.
+    Copy is consistent if no data update started before copy finished.
+    """
+    for _ in range(retry):
+        version = data.mVersionUpdateEnd
+        ctypes.memmove(dest_addr, src_addr, size)
+        if version == data.mVersionUpdateBegin:
+            return True
+    return False
+
+
+def pin_current_thread(cpu_core: int) -> None:
+    """Pin current thread to CPU core
+
+    Keep thread data cached on the same core.
+    Also raise thread priority on Windows.
+    """
+    if cpu_core < 0:
+        logger.warning("sharedmemory: invalid CPU core %s", cpu_core)
+    elif PLATFORM == "Windows":
+        # Own kernel32 instance, don't change prototypes of shared windll
+        kernel32 = ctypes.WinDLL("kernel32")
+        # HANDLE is void pointer, BOOL is int
+        kernel32.GetCurrentThread.restype = ctypes.c_void_p
+        kernel32.SetThreadAffinityMask.argtypes = (ctypes.c_void_p, ctypes.c_size_t)
+        kernel32.SetThreadAffinityMask.restype = ctypes.c_size_t
+        kernel32.SetThreadPriority.argtypes = (ctypes.c_void_p, ctypes.c_int)
+        kernel32.SetThreadPriority.restype = ctypes.c_int
+        thread = kernel32.GetCurrentThread()
+        if not kernel32.SetThreadAffinityMask(thread, 1 << cpu_core):
+            logger.warning("sharedmemory: failed to set CPU core %s", cpu_core)
+        kernel32.SetThreadPriority(thread, THREAD_PRIORITY_ABOVE_NORMAL)
+    elif PLATFORM == "Linux":
+        try:
+            os.sched_setaffinity(0, {cpu_core})
+        except OSError:
+            logger.warning("sharedmemory: failed to set CPU core %s", cpu_core)
+    else:
+        logger.warning("sharedmemory: CPU core pinning not supported")
+
+
 def platform_mmap(name: str, size: int, pid: str = "") -> mmap:
     """Platform memory mapping"""
     if PLATFORM == "Windows":
@@ -39,12 +135,17 @@ def windows_mmap(name: str, size: int, pid: str) -> mmap:
 
 
 def linux_mmap(name: str, size: int) -> mmap:
-    """Linux mmap"""
-    file = open("/dev/shm/" + name, "a+")
-    if file.tell() == 0:
-        file.write("\0" * size)
-        file.flush()
-    return mmap.mmap(file.fileno(), size)
+    """Linux mmap
+
+    File descriptor is closed after mapping, mmap stays valid.
+    """
+    fd = os.open("/dev/shm/" + name, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        return mmap.mmap(fd, size)
+    finally:
+        os.close(fd)
 
 
 class RF2MMap:
@@ -59,20 +160,22 @@ class RF2MMap:
         self.mmap_id = mmap_name.strip("$")
         self._mmap_name = mmap_name
         self._rf2_data = rf2_data
+        self._mmap_size = ctypes.sizeof(rf2_data)
         self._mmap_instance = None
+        self._mmap_view = None
         self._mmap_output = None
         self._access_mode = 0
-        self._buffer_sharing = False
 
     def create(self, access_mode: int = 0, rf2_pid: str = "") -> None:
-        """Create mmap instance & initial accessible copy"""
+        """Create mmap instance, live view & initial accessible copy"""
         self._access_mode = access_mode
         self._mmap_instance = platform_mmap(
             name=self._mmap_name,
-            size=ctypes.sizeof(self._rf2_data),
+            size=self._mmap_size,
             pid=rf2_pid
         )
-        self.__buffer_copy(True)
+        self._mmap_view = self._rf2_data.from_buffer(self._mmap_instance)
+        self.__buffer_copy(self._mmap_view, True)
         mode = "Direct" if access_mode else "Copy"
         logger.info("sharedmemory: ACTIVE: %s (%s Access)", self.mmap_id, mode)
 
@@ -80,37 +183,58 @@ class RF2MMap:
         """Close memory mapping
 
         Create a final accessible mmap data copy before closing mmap instance.
+        Release live view first, mmap can't be closed while views exist.
         """
-        self.__buffer_copy(True)
-        self._buffer_sharing = False
-        try:
-            self._mmap_instance.close()
-            logger.info("sharedmemory: CLOSED: %s", self.mmap_id)
-        except BufferError:
-            logger.error("sharedmemory: buffer error while closing mmap")
+        self.__buffer_copy(self._mmap_view, True)
+        self._mmap_view = None
+        for _ in range(2):
+            try:
+                self._mmap_instance.close()
+                logger.info("sharedmemory: CLOSED: %s", self.mmap_id)
+                return
+            except BufferError:
+                # Collect views only referenced by garbage cycles, retry
+                gc.collect()
+        logger.error(
+            "sharedmemory: buffer error while closing mmap, data view still referenced: %s",
+            self.mmap_id)
 
-    def update(self) -> None:
-        """Update mmap data"""
-        if self._access_mode:
-            self.__buffer_share()
-        else:
-            self.__buffer_copy()
+    @property
+    def view(self):
+        """Live mmap data view, final copy if closed"""
+        view = self._mmap_view
+        if view is None:
+            return self._mmap_output
+        return view
 
     @property
     def data(self):
-        """Output mmap data"""
+        """Output mmap data
+
+        Direct access returns live mmap view.
+        Copy access takes a new snapshot on demand if data version changed.
+        Live view is read once, close() may release it from another thread.
+        """
+        view = self._mmap_view
+        if view is None:
+            return self._mmap_output
+        if self._access_mode:
+            return view
+        if self._mmap_output.mVersionUpdateEnd != view.mVersionUpdateEnd:
+            self.__buffer_copy(view)
         return self._mmap_output
 
-    def __buffer_share(self) -> None:
-        """Share buffer direct access, may result desync"""
-        if not self._buffer_sharing:
-            self._buffer_sharing = True
-            self._mmap_output = self._rf2_data.from_buffer(self._mmap_instance)
+    def __buffer_copy(self, view, skip_check=False) -> None:
+        """Copy buffer access from live view, check version before copy & assign
 
-    def __buffer_copy(self, skip_check=False) -> None:
-        """Copy buffer access, check version before assign"""
-        temp = self._rf2_data.from_buffer_copy(self._mmap_instance)
-        if temp.mVersionUpdateEnd == temp.mVersionUpdateBegin or skip_check:
+        Skip copying while data is being written,
+        discard copy if data update started during copy.
+        """
+        version = view.mVersionUpdateEnd
+        if not skip_check and version != view.mVersionUpdateBegin:
+            return
+        temp = self._rf2_data.from_buffer_copy(view)
+        if skip_check or version == view.mVersionUpdateBegin:
             self._mmap_output = temp
 
 
@@ -134,11 +258,6 @@ class MMapDataSet:
         for data in self.mmap_active:
             data.close()
 
-    def update_mmap(self) -> None:
-        """Update mmap data"""
-        for data in self.mmap_active:
-            data.update()
-
     @property
     def scor(self):
         """Scoring data"""
@@ -159,6 +278,16 @@ class MMapDataSet:
         """Force feedback data"""
         return self._ffb.data
 
+    @property
+    def scor_view(self):
+        """Scoring live mmap view"""
+        return self._scor.view
+
+    @property
+    def tele_view(self):
+        """Telemetry live mmap view"""
+        return self._tele.view
+
 
 class SyncData:
     """Synchronize data with player ID"""
@@ -171,17 +300,63 @@ class SyncData:
         self.event = threading.Event()
 
         self.override_player_index = False
+        self.cpu_core = None
         self.player_scor_index = INVALID_INDEX
-        self.player_scor = None
-        self.player_tele = None
+        self.player_tele_index = INVALID_INDEX
+        # Double buffered player data, published by switching slot index
+        self._player_scor_bufs = (
+            rF2data.rF2VehicleScoring(), rF2data.rF2VehicleScoring())
+        self._player_tele_bufs = (
+            rF2data.rF2VehicleTelemetry(), rF2data.rF2VehicleTelemetry())
+        self._player_scor_addrs = tuple(map(ctypes.addressof, self._player_scor_bufs))
+        self._player_tele_addrs = tuple(map(ctypes.addressof, self._player_tele_bufs))
+        self._player_scor_slot = 0
+        self._player_tele_slot = 0
+        # Numpy vehicle views over mmap data, None if numpy not available
+        self._scor_veh_np = None
+        self._tele_veh_np = None
+
+    @property
+    def player_scor(self):
+        """Scoring player data, last published copy"""
+        return self._player_scor_bufs[self._player_scor_slot]
+
+    @property
+    def player_tele(self):
+        """Telemetry player data, last published copy"""
+        return self._player_tele_bufs[self._player_tele_slot]
 
     def copy_player_scor(self, index: int = INVALID_INDEX) -> None:
-        """Copy scoring player data"""
-        self.player_scor = copy.deepcopy(self.dataset.scor.mVehicles[index])
+        """Copy scoring player data
+
+        Copy into inactive buffer, then publish it as active buffer
+        if copy is consistent.
+        """
+        data = self.dataset.scor_view
+        slot = 1 - self._player_scor_slot
+        # Negative index counts from end, same as ctypes array
+        src_addr = (ctypes.addressof(data) + SCOR_VEH_OFFSET
+                    + index % MAX_VEHICLES * SCOR_VEH_SIZE)
+        copied = version_synced_copy(
+            self._player_scor_addrs[slot], data, src_addr, SCOR_VEH_SIZE)
+        if copied:
+            self._player_scor_slot = slot
 
     def copy_player_tele(self, index: int = INVALID_INDEX) -> None:
-        """Copy telemetry player data"""
-        self.player_tele = copy.deepcopy(self.dataset.tele.mVehicles[index])
+        """Copy telemetry player data
+
+        Copy into inactive buffer, then publish it as active buffer
+        if copy is consistent.
+        """
+        data = self.dataset.tele_view
+        slot = 1 - self._player_tele_slot
+        # Negative index counts from end, same as ctypes array
+        src_addr = (ctypes.addressof(data) + TELE_VEH_OFFSET
+                    + index % MAX_VEHICLES * TELE_VEH_SIZE)
+        copied = version_synced_copy(
+            self._player_tele_addrs[slot], data, src_addr, TELE_VEH_SIZE)
+        if copied:
+            self._player_tele_slot = slot
 
     def __local_scor_index(self) -> int:
         """Find local player scoring index
@@ -189,8 +364,15 @@ class SyncData:
         Check last found index first.
         If not player, loop through all vehicles.
         """
-        for scor_idx in range(MAX_VEHICLES):
-            if self.dataset.scor.mVehicles[scor_idx].mIsPlayer:
+        scor_veh = self.dataset.scor_view.mVehicles
+        scor_idx = self.player_scor_index
+        if scor_idx != INVALID_INDEX and scor_veh[scor_idx].mIsPlayer:
+            return scor_idx
+        scor_veh_np = self._scor_veh_np
+        if scor_veh_np is not None:
+            return np_first_index(scor_veh_np["mIsPlayer"])
+        for scor_idx in VEHICLE_RANGE:
+            if scor_veh[scor_idx].mIsPlayer:
                 return scor_idx
         return INVALID_INDEX
 
@@ -205,27 +387,57 @@ class SyncData:
         # Copy scoring data
         self.copy_player_scor(self.player_scor_index)
         # Update telemetry index
-        tele_idx = self.sync_tele_index(self.player_scor_index)
+        tele_idx = self.sync_tele_index(self.player_scor_index, self.player_tele_index)
         if tele_idx != INVALID_INDEX:
+            self.player_tele_index = tele_idx
             # Copy telemetry data
             self.copy_player_tele(tele_idx)
         return True  # found index, synced
 
-    def sync_tele_index(self, scor_idx: int) -> int:
+    def sync_tele_index(self, scor_idx: int, tele_idx: int = None) -> int:
         """Sync telemetry index with scoring index using mID
 
         Telemetry index can be different from scoring index.
         Use mID matching to find telemetry index.
 
-        Compare scor mid with tele mid first.
+        Compare scor mid with tele mid at tele_idx first,
+        defaults to same index as scoring.
         If not same, loop through all vehicles.
         """
-        scor_mid = self.dataset.scor.mVehicles[scor_idx].mID
-        for tele_idx in range(MAX_VEHICLES):
-            if self.dataset.tele.mVehicles[tele_idx].mID == scor_mid:
+        if tele_idx is None:
+            tele_idx = scor_idx
+        tele_veh = self.dataset.tele_view.mVehicles
+        scor_mid = self.dataset.scor_view.mVehicles[scor_idx].mID
+        if tele_idx != INVALID_INDEX and tele_veh[tele_idx].mID == scor_mid:
+            return tele_idx
+        tele_veh_np = self._tele_veh_np
+        if tele_veh_np is not None:
+            return np_first_index(tele_veh_np["mID"] == scor_mid)
+        for tele_idx in VEHICLE_RANGE:
+            if tele_veh[tele_idx].mID == scor_mid:
                 return tele_idx
         return INVALID_INDEX
 
+    def __create_np_views(self) -> None:
+        """Create numpy vehicle views over mmap data for index lookup"""
+        if np is None:
+            return
+        self._scor_veh_np = np.frombuffer(
+            self.dataset.scor_view,
+            dtype=SCOR_VEH_DTYPE,
+            count=MAX_VEHICLES,
+            offset=SCOR_VEH_OFFSET)
+        self._tele_veh_np = np.frombuffer(
+            self.dataset.tele_view,
+            dtype=TELE_VEH_DTYPE,
+            count=MAX_VEHICLES,
+            offset=TELE_VEH_OFFSET)
+
+    def __release_np_views(self) -> None:
+        """Release numpy vehicle views, required before closing mmap"""
+        self._scor_veh_np = None
+        self._tele_veh_np = None
+
     def start(self, access_mode: int, rf2_pid: str) -> None:
         """Update & sync mmap data copy in separate thread"""
         if self.updating:
@@ -234,6 +446,7 @@ class SyncData:
             self.updating = True
             self.event.clear()
             self.dataset.create_mmap(access_mode, rf2_pid)
+            self.__create_np_views()
             self.copy_player_scor()
             self.copy_player_tele()
 
@@ -243,6 +456,7 @@ class SyncData:
             logger.info("sharedmemory: UPDATING: thread started")
             logger.info("sharedmemory: player index override: %s", self.override_player_index)
             logger.info("sharedmemory: server process ID: %s", rf2_pid if rf2_pid else "DISABLED")
+            logger.info("sharedmemory: CPU core: %s", self.cpu_core)
 
     def stop(self) -> None:
         """Join and stop updating thread, close mmap"""
@@ -250,23 +464,45 @@ class SyncData:
             self.event.set()
             self.updating = False
             self.update_thread.join()
+            self.__release_np_views()
             self.dataset.close_mmap()
         else:
             logger.warning("sharedmemory: UPDATING: already stopped")
 
     def __update(self) -> None:
-        """Update synced player data"""
-        last_version_update = 0  # store last data version update
+        """Update synced player data
+
+        Wait on stop event between updates, so stopping wakes thread at once.
+        Read data versions once per update before touching any vehicle data,
+        skip syncing if neither scoring nor telemetry data version changed.
+        Back off update delay exponentially while data version is unchanged,
+        from 0.01 up to 0.5 seconds.
+        """
+        if self.cpu_core is not None:
+            pin_current_thread(self.cpu_core)
+        scor = self.dataset.scor_view
+        tele = self.dataset.tele_view
+        # scoring & telemetry version last synced
+        last_version_synced = (scor.mVersionUpdateEnd, tele.mVersionUpdateEnd)
+        last_update_time = time.time()
         data_freezed = True      # whether data is freezed
-        check_timer_start = 0
         reset_counter = 0
+        idle_ticks = 6  # updates without data version change
         update_delay = 0.5  # longer delay while inactive
 
         while not self.event.wait(update_delay):
-            self.dataset.update_mmap()
-            # Update player data & index
-            if not data_freezed:
-                # Get player data
+            version_synced = (scor.mVersionUpdateEnd, tele.mVersionUpdateEnd)
+            if version_synced != last_version_synced:
+                last_version_synced = version_synced
+                last_update_time = time.time()
+                idle_ticks = 0
+                if data_freezed:
+                    data_freezed = False
+                    self.paused = False
+                    logger.info(
+                        "sharedmemory: UPDATING: resumed, data version %s",
+                        version_synced[0])
+                # Update player data & index
                 data_synced = self.__sync_player_data()
                 # Pause if local player index no longer exists, 5 tries
                 if not data_synced and reset_counter < 6:
@@ -278,28 +514,16 @@ class SyncData:
                 if reset_counter == 5:
                     self.paused = True
                     logger.info("sharedmemory: UPDATING: player data paused")
-
-            # Start checking data version update status
-            if time.time() - check_timer_start > 5:
-                if (not data_freezed
-                    and last_version_update == self.dataset.scor.mVersionUpdateEnd):
-                    update_delay = 0.5
+            else:
+                idle_ticks += 1
+                # Pause if data version not updated for 5 seconds
+                if not data_freezed and time.time() - last_update_time > 5:
                     data_freezed = True
                     self.paused = True
                     logger.info(
                         "sharedmemory: UPDATING: paused, data version %s",
-                        last_version_update)
-                last_version_update = self.dataset.scor.mVersionUpdateEnd
-                check_timer_start = time.time()  # reset timer
-
-            if (data_freezed
-                and last_version_update != self.dataset.scor.mVersionUpdateEnd):
-                update_delay = 0.01
-                data_freezed = False
-                self.paused = False
-                logger.info(
-                    "sharedmemory: UPDATING: resumed, data version %s",
-                    self.dataset.scor.mVersionUpdateEnd)
+                        last_version_synced[0])
+            update_delay = min(0.5, 0.01 * (1 << min(idle_ticks, 6)))
 
         self.paused = False
         logger.info("sharedmemory: UPDATING: thread stopped")
@@ -314,6 +538,7 @@ class RF2SM:
         setPID: set process ID for connecting to server data (str)
         setPlayerOverride: enable player index override (bool)
         setPlayerIndex: manually set player index (int)
+        setCPUCore: pin updating thread to CPU core (int), None = not pinned
     """
 
     def __init__(self) -> None:
@@ -345,6 +570,12 @@ class RF2SM:
         """Set player index"""
         self._sync.player_scor_index = min(max(idx, INVALID_INDEX), MAX_VEHICLES - 1)
 
+    def setCPUCore(self, core: int = None) -> None:
+        """Set CPU core for updating thread, None = not pinned"""
+        if core is not None and (not isinstance(core, int) or core < 0):
+            raise ValueError(f"CPU core must be a non-negative int or None: {core}")
+        self._sync.cpu_core = core
+
     @property
     def rf2ScorInfo(self):
         """rF2 scoring info data"""
@@ -354,7 +585,8 @@ class RF2SM:
         """rF2 scoring vehicle data
 
         Specify index for specific player.
-        None for local player.
+        None for local player, returns last published player data buffer
+        without copying, read it before next update to get a stable snapshot.
         """
         if index is None:
             return self._sync.player_scor
@@ -364,12 +596,31 @@ class RF2SM:
         """rF2 telemetry vehicle data
 
         Specify index for specific player.
-        None for local player.
+        None for local player, returns last published player data buffer
+        without copying, read it before next update to get a stable snapshot.
         """
         if index is None:
             return self._sync.player_tele
         return self._sync.dataset.tele.mVehicles[self._sync.sync_tele_index(index)]
 
+    def rf2ScorVehArray(self):
+        """rF2 scoring local player data as numpy structured view
+
+        Zero copy view of last published player data buffer, requires numpy.
+        """
+        if np is None:
+            raise ImportError("numpy is required for array access")
+        return np.frombuffer(self._sync.player_scor, dtype=SCOR_VEH_DTYPE)[0]
+
+    def rf2TeleVehArray(self):
+        """rF2 telemetry local player data as numpy structured view
+
+        Zero copy view of last published player data buffer, requires numpy.
+        """
+        if np is None:
+            raise ImportError("numpy is required for array access")
+        return np.frombuffer(self._sync.player_tele, dtype=TELE_VEH_DTYPE)[0]
+
     @property
     def rf2Ext(self):
         """rF2 extended data"""
@@ -411,6 +662,7 @@ if __name__ == "__main__":
     info.setPID("")
     info.setPlayerOverride(True)  # enable player override
     info.setPlayerIndex(0)  # set player index to 0
+    info.setCPUCore(0)  # pin updating thread to CPU core 0
     info.start()
     time.sleep(0.2)
 
@@ -0,0 +1,207 @@
+import ctypes
+import os
+import time
+import unittest
+from unittest import mock
+
+import rF2data
+import rF2MMap
+from rF2MMap import (MAX_VEHICLES, PLATFORM, RF2MMap, RF2SM, SyncData,
+                     pin_current_thread, platform_mmap, version_synced_copy)
+
+TEST_MMAP_NAME = '$rF2MMapTest_Scoring$'
+
+
+class Test_rF2MMap(unittest.TestCase):
+    def setUp(self):
+        self.writer_mmap = platform_mmap(
+            TEST_MMAP_NAME, ctypes.sizeof(rF2data.rF2Scoring))
+        self.writer = rF2data.rF2Scoring.from_buffer(self.writer_mmap)
+        self.writer.mVersionUpdateBegin = 0
+        self.writer.mVersionUpdateEnd = 0
+
+    def tearDown(self):
+        del self.writer
+        self.writer_mmap.close()
+        if PLATFORM != 'Windows':
+            os.remove('/dev/shm/' + TEST_MMAP_NAME)
+
+    def write_frame(self, num_vehicles):
+        self.writer.mVersionUpdateBegin += 1
+        self.writer.mScoringInfo.mNumVehicles = num_vehicles
+        self.writer.mVersionUpdateEnd += 1
+
+    def test_copy_access_snapshot_on_version_change(self):
+        scor = RF2MMap(TEST_MMAP_NAME, rF2data.rF2Scoring)
+        scor.create(0)
+        self.write_frame(5)
+        snapshot = scor.data
+        assert snapshot.mScoringInfo.mNumVehicles == 5
+        # Unchanged version returns the same snapshot
+        assert scor.data is snapshot
+        self.write_frame(6)
+        assert snapshot.mScoringInfo.mNumVehicles == 5
+        assert scor.data.mScoringInfo.mNumVehicles == 6
+        scor.close()
+
+    def test_copy_access_skips_torn_frame(self):
+        scor = RF2MMap(TEST_MMAP_NAME, rF2data.rF2Scoring)
+        scor.create(0)
+        self.write_frame(5)
+        assert scor.data.mScoringInfo.mNumVehicles == 5
+        self.writer.mVersionUpdateBegin += 1
+        self.writer.mScoringInfo.mNumVehicles = 7
+        assert scor.data.mScoringInfo.mNumVehicles == 5
+        self.writer.mVersionUpdateEnd += 1
+        assert scor.data.mScoringInfo.mNumVehicles == 7
+        scor.close()
+
+    def test_direct_access_live_view(self):
+        scor = RF2MMap(TEST_MMAP_NAME, rF2data.rF2Scoring)
+        scor.create(1)
+        self.write_frame(5)
+        assert scor.data.mScoringInfo.mNumVehicles == 5
+        self.write_frame(6)
+        assert scor.view.mScoringInfo.mNumVehicles == 6
+        scor.close()
+
+    def test_close_keeps_final_copy(self):
+        scor = RF2MMap(TEST_MMAP_NAME, rF2data.rF2Scoring)
+        scor.create(0)
+        self.write_frame(5)
+        scor.close()
+        self.write_frame(6)
+        assert scor.data.mScoringInfo.mNumVehicles == 5
+        assert scor.view.mScoringInfo.mNumVehicles == 5
+
+    def test_close_releases_views_in_cycles(self):
+        scor = RF2MMap(TEST_MMAP_NAME, rF2data.rF2Scoring)
+        scor.create(1)
+        cycle = [scor.data.mVehicles[0]]
+        cycle.append(cycle)
+        del cycle
+        scor.close()
+        assert scor._mmap_instance.closed
+
+    def test_version_synced_copy(self):
+        data = rF2data.rF2Scoring()
+        data.mVehicles[2].mID = 42
+        dest = rF2data.rF2VehicleScoring()
+        dest_addr = ctypes.addressof(dest)
+        src_addr = ctypes.addressof(data.mVehicles[2])
+        size = ctypes.sizeof(dest)
+        data.mVersionUpdateBegin = data.mVersionUpdateEnd = 5
+        assert version_synced_copy(dest_addr, data, src_addr, size)
+        assert dest.mID == 42
+        # Data update in progress
+        data.mVersionUpdateBegin = 6
+        assert not version_synced_copy(dest_addr, data, src_addr, size)
+
+    @unittest.skipIf(rF2MMap.np is None, 'numpy not installed')
+    def test_np_dtype_layout(self):
+        veh = rF2data.rF2VehicleTelemetry()
+        veh.mID = 42
+        veh.mVehicleName = b'Test Car'
+        veh.mWheels[3].mTemperature[2] = 300.5
+        veh.mWheels[3].mTerrainName = b'ROAD'
+        veh_np = rF2MMap.np.frombuffer(veh, dtype=rF2MMap.TELE_VEH_DTYPE)[0]
+        assert rF2MMap.TELE_VEH_DTYPE.itemsize == ctypes.sizeof(veh)
+        assert veh_np['mID'] == 42
+        assert veh_np['mVehicleName'] == b'Test Car'
+        assert veh_np['mWheels'][3]['mTemperature'][2] == 300.5
+        assert veh_np['mWheels'][3]['mTerrainName'] == b'ROAD'
+
+
+class Test_SyncData(unittest.TestCase):
+    def setUp(self):
+        self.sync = SyncData()
+        self.sync.start(0, '')
+        self.scor = self.sync.dataset.scor_view
+        self.tele = self.sync.dataset.tele_view
+
+    def tearDown(self):
+        del self.scor, self.tele
+        self.sync.stop()
+
+    def write_player(self, scor_idx, tele_idx, mid):
+        for data in (self.scor, self.tele):
+            data.mVersionUpdateBegin += 1
+        for idx in range(MAX_VEHICLES):
+            self.scor.mVehicles[idx].mIsPlayer = idx == scor_idx
+            self.scor.mVehicles[idx].mID = mid + 1
+            self.tele.mVehicles[idx].mID = mid + 1
+        self.scor.mVehicles[scor_idx].mID = mid
+        self.tele.mVehicles[tele_idx].mID = mid
+        self.tele.mVehicles[tele_idx].mGear = 3
+        for data in (self.scor, self.tele):
+            data.mVersionUpdateEnd += 1
+
+    def wait_synced(self, scor_idx, tele_idx, mid, timeout=2):
+        """Keep writing frames like rF2 until player data synced"""
+        deadline = time.time() + timeout
+        while self.sync.player_tele.mID != mid and time.time() < deadline:
+            self.write_player(scor_idx, tele_idx, mid)
+            time.sleep(0.01)
+
+    def test_sync_player_data(self):
+        self.wait_synced(3, 7, 42)
+        assert self.sync.player_scor_index == 3
+        assert self.sync.sync_tele_index(3) == 7
+        assert self.sync.player_scor.mID == 42
+        assert self.sync.player_tele.mID == 42
+        assert self.sync.player_tele.mGear == 3
+
+    def test_sync_player_data_index_changed(self):
+        self.wait_synced(3, 7, 42)
+        self.wait_synced(5, 2, 43)
+        assert self.sync.player_scor_index == 5
+        assert self.sync.player_tele_index == 2
+        assert self.sync.player_scor.mID == 43
+
+
+class Test_RF2SM(unittest.TestCase):
+    @unittest.skipIf(rF2MMap.np is None, 'numpy not installed')
+    def test_player_array_view(self):
+        info = RF2SM()
+        info._sync.player_scor.mID = 42
+        info._sync.player_tele.mID = 42
+        info._sync.player_tele.mGear = 3
+        tele_np = info.rf2TeleVehArray()
+        assert tele_np['mID'] == 42
+        assert tele_np['mGear'] == 3
+        assert info.rf2ScorVehArray()['mID'] == 42
+        # View reads published buffer without copy
+        info._sync.player_tele.mGear = 4
+        assert tele_np['mGear'] == 4
+
+    @unittest.skipIf(PLATFORM != 'Linux', 'Linux only')
+    def test_cpu_core_pinned_in_thread(self):
+        affinity = []
+
+        def pin_and_check(cpu_core):
+            pin_current_thread(cpu_core)
+            affinity.append(os.sched_getaffinity(0))
+
+        core = min(os.sched_getaffinity(0))
+        info = RF2SM()
+        info.setCPUCore(core)
+        with mock.patch('rF2MMap.pin_current_thread', pin_and_check):
+            info.start()
+            deadline = time.time() + 2
+            while not affinity and time.time() < deadline:
+                time.sleep(0.01)
+            info.stop()
+        assert affinity == [{core}]
+
+    def test_invalid_cpu_core(self):
+        info = RF2SM()
+        for core in (-1, 1.5, '0'):
+            with self.assertRaises(ValueError):
+                info.setCPUCore(core)
+        info.setCPUCore(None)
+        with self.assertLogs('rF2MMap', 'WARNING'):
+            pin_current_thread(-1)
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)